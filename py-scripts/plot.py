@@ -1,14 +1,29 @@
 import argparse
-from pathlib import Path
+import os
 import re
+from itertools import cycle
+from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import seaborn as sns
 import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
+
+# Column types of the benchmark CSVs written by `save_csv` in src/main.rs
+CSV_TYPES = {"size": pa.int32(), "duration": pa.float64()}
+# Both sources share one categorical dtype so that concatenation keeps it
+SOURCE_DTYPE = pd.CategoricalDtype(["Quartz", "Portmatching"])
+# Dataset names have the format "{n_qbs}_{n_gates}-{dataset_type}"
+DATASET_NAME_RE = re.compile(r'(?P<n_qubits>\d+)_(\d+)-(?P<dtype>.+)')
+# Parsed data is cached in results/.cache/v{CACHE_VERSION}. Bump the version
+# whenever the loading or renaming changes the shape of the cached frames
+CACHE_VERSION = 1
 
-def create_eccs_plot(all_data):
-    eccs_data = all_data[all_data['dataset type'] == 'eccs']
-    col_order = sorted(eccs_data['n_qubits'].unique())
+def create_eccs_plot(eccs_facets):
+    col_order = list(eccs_facets)
 
     sns.set_style('ticks', {
         'grid.linestyle': ':',
@@ -18,32 +33,53 @@ def create_eccs_plot(all_data):
     sns.set_context("paper")
 
     order = ['Portmatching', 'Quartz']
-    # Create a plot comparing portmatching with quartz
-    f = sns.relplot(
-        data=eccs_data,
-        x="Number of patterns",
-        y="Runtime (s)",
-        style="Pattern matching algorithm",
-        style_order=order,
-        markers=["P", "^"],
-        hue="Pattern matching algorithm",
-        hue_order=order,
-        col="n_qubits",
-        col_order=col_order,
-        palette="colorblind",
-        # facet_kws={"sharex": False, "sharey": False},
+    markers = dict(zip(order, ["P", "^"]))
+    colors = dict(zip(order, sns.color_palette("colorblind")))
+    # Create a plot comparing portmatching with quartz, one facet per qubit count
+    f, axes = plt.subplots(
+        1,
+        len(col_order),
+        sharex=True,
+        sharey=True,
+        squeeze=False,
+        figsize=(5 * len(col_order), 5),
     )
-    for axs in f.axes:
-        for ax in axs:
-            ax.grid(axis='y')
+    for ax, qb in zip(axes[0], col_order):
+        groups = eccs_facets[qb].groupby('Pattern matching algorithm', observed=True, sort=False)
+        for algo, g in groups:
+            ax.scatter(
+                g['Number of patterns'],
+                g['Runtime (s)'],
+                marker=markers[algo],
+                color=colors[algo],
+            )
+        ax.set_title(f"n_qubits = {qb}")
+        ax.set_xlabel("Number of patterns")
+        ax.grid(axis='y')
+    axes[0][0].set_ylabel("Runtime (s)")
+    sns.despine(f)
+    f.tight_layout()
 
-    sns.move_legend(f, "upper left", bbox_to_anchor=(0.1, 0.9), frameon=True, alignment='left')
+    handles = [
+        Line2D([], [], linestyle="none", marker=markers[algo], color=colors[algo], label=algo)
+        for algo in order
+    ]
+    f.legend(
+        handles=handles,
+        title="Pattern matching algorithm",
+        loc="upper left",
+        bbox_to_anchor=(0.1, 0.9),
+        frameon=True,
+        alignment='left',
+    )
     plt.savefig("eccs-plot.pdf")
 
-def create_random_plot(all_data):
-    random_data = all_data[all_data['dataset type'] == 'random']
-    random_data = random_data[random_data['Pattern matching algorithm'] == 'Portmatching']
-    qubit_order = sorted(random_data['n_qubits'].unique())
+def create_random_plot(random_facets):
+    random_facets = {
+        qb: g[g['Pattern matching algorithm'] == 'Portmatching']
+        for qb, g in random_facets.items()
+    }
+    qubit_order = [qb for qb, g in random_facets.items() if not g.empty]
 
     sns.set_style('ticks', {
         'grid.linestyle': ':',
@@ -52,24 +88,32 @@ def create_random_plot(all_data):
     })
     sns.set_context("paper")
 
+    markers = dict(zip(qubit_order, cycle(["o", "X", "s", "P", "D", "^", "v"])))
+    colors = dict(zip(qubit_order, sns.color_palette("crest_r", len(qubit_order))))
     # Create a plot comparing portmatching across qubit counts
-    f = sns.relplot(
-        data=random_data,
-        x="Number of patterns",
-        y="Runtime (s)",
-        hue="n_qubits",
-        style="n_qubits",
-        style_order=qubit_order,
-        hue_order=qubit_order,
-        # markers=["P", "^"],
-        palette="crest_r",
-    )
+    f, ax = plt.subplots(figsize=(5, 5))
+    for qb in qubit_order:
+        g = random_facets[qb]
+        ax.scatter(
+            g['Number of patterns'],
+            g['Runtime (s)'],
+            marker=markers[qb],
+            color=colors[qb],
+            label=qb,
+        )
+    ax.set_xlabel("Number of patterns")
+    ax.set_ylabel("Runtime (s)")
+    ax.grid(axis='y')
+    sns.despine(f)
+    f.tight_layout()
 
-    for axs in f.axes:
-        for ax in axs:
-            ax.grid(axis='y')
-
-    sns.move_legend(f, "upper left", bbox_to_anchor=(0.2, 0.95), frameon=True, alignment='left')
+    f.legend(
+        title="n_qubits",
+        loc="upper left",
+        bbox_to_anchor=(0.2, 0.95),
+        frameon=True,
+        alignment='left',
+    )
     plt.savefig("random-plot.pdf")
 
 def get_results_folder():
@@ -81,27 +125,76 @@ def get_results_folder():
     args = parser.parse_args()
     return Path(args.results_folder)
 
+def read_csv(path, cache_path):
+    # Reuse the Parquet shard of the file unless the CSV was modified since
+    if cache_path.exists() and cache_path.stat().st_mtime >= os.stat(path).st_mtime:
+        table = pq.read_table(cache_path)
+    else:
+        # Arrow parses the file with multiple threads and the resulting
+        # columns stay Arrow-backed in pandas
+        table = pacsv.read_csv(
+            path,
+            read_options=pacsv.ReadOptions(use_threads=True),
+            convert_options=pacsv.ConvertOptions(column_types=CSV_TYPES),
+        )
+        pq.write_table(table, cache_path)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+def load_folder(folder, source):
+    # Get the list of non-empty CSV files in the folder, keyed by dataset name.
+    # Zero-byte files are left behind by crashed runs; the folder may end up
+    # with no files at all, which is handled below
+    files = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".csv"):
+                continue
+            if entry.stat().st_size == 0:
+                print(f"Warning: skipping empty results file {entry.path}")
+                continue
+            files[entry.name[:-len(".csv")]] = entry.path
+
+    # Parsed files are cached as Parquet shards next to the full data cache
+    cache_folder = cache_root(folder.parent) / folder.name
+    cache_folder.mkdir(parents=True, exist_ok=True)
+
+    if files:
+        # Concatenate once, turning the dataset names into a column. No local
+        # holds on to the per-file frames, so they are freed when the concat
+        # returns rather than staying alive during reset_index and assign
+        data = pd.concat(
+            (read_csv(path, cache_folder / f"{name}.parquet") for name, path in files.items()),
+            keys=list(files),
+            names=["dataset", None],
+            sort=False,
+        )
+        data = data.reset_index(level="dataset")
+    else:
+        # No results for this source, keep the other source plottable
+        data = pa.schema(list(CSV_TYPES.items())).empty_table().to_pandas(
+            types_mapper=pd.ArrowDtype
+        )
+        data.insert(0, "dataset", pd.Series(dtype=object))
+    return data.assign(source=pd.Series(source, index=data.index, dtype=SOURCE_DTYPE))
+
 def load_data(results_folder):
-    all_data = pd.DataFrame()
-
-    # Get the list of CSV files in the quartz subfolder
-    quartz_folder = results_folder / "quartz"
-    for file in quartz_folder.iterdir():
-        if file.suffix == ".csv":
-            data = pd.read_csv(file)
-            data["source"] = "Quartz"
-            data["dataset"] = file.stem
-            all_data = pd.concat([all_data, data], ignore_index=True)
-
-    # Get the list of CSV files in the portmatching subfolder
-    portmatching_folder = results_folder / "portmatching"
-    for file in portmatching_folder.iterdir():
-        if file.suffix == ".csv":
-            data = pd.read_csv(file)
-            data["source"] = "Portmatching"
-            data["dataset"] = file.stem
-            all_data = pd.concat([all_data, data], ignore_index=True)
-    return all_data
+    return pd.concat(
+        [
+            load_folder(results_folder / "quartz", "Quartz"),
+            load_folder(results_folder / "portmatching", "Portmatching"),
+        ],
+        ignore_index=True,
+        sort=False,
+    )
+
+def parse_dataset_name(name):
+    # Returns the number of qubits and the dataset type in a single match
+    match = DATASET_NAME_RE.search(name)
+    if match:
+        return match.group("n_qubits"), match.group("dtype")
+    else:
+        print("Warning: could not extract number of qubits and dataset type from dataset name")
+        return name, name
 
 def rename_data_columns(all_data):
     # Rename the columns for plotting
@@ -113,42 +206,74 @@ def rename_data_columns(all_data):
         },
     )
 
-    # Get the number of qubits from the dataset name
-    def get_qb(s):
-        # string format: "{n_qbs}_{n_gates}-{dataset_type}}"
-        match = re.search(r'(\d+)_(\d+)-.+', s)
-        if match:
-            return match.group(1)
-        else:
-            print("Warning: could not extract number of qubits from dataset name")
-            return s
-
-    # Get the number of qubits from the dataset name
-    def get_type(s):
-        # string format: "{n_qbs}_{n_gates}-{dataset_type}}"
-        match = re.search(r'(\d+)_(\d+)-(.+)', s)
-        if match:
-            return match.group(3)
-        else:
-            print("Warning: could not extract dataset type from dataset name")
-            return s
-
-    renamed_data["n_qubits"] = all_data["dataset"].apply(get_qb)
-    renamed_data['dataset type'] = all_data['dataset'].apply(get_type)
+    # Get the number of qubits and the dataset type from the dataset name
+    # There are only a handful of distinct dataset names, so parse each once
+    qb_map, type_map = {}, {}
+    for name in all_data["dataset"].unique():
+        qb_map[name], type_map[name] = parse_dataset_name(name)
+    renamed_data["n_qubits"] = all_data["dataset"].map(qb_map)
+    renamed_data["dataset type"] = all_data["dataset"].map(type_map)
+
+    # Encode the grouping columns as categoricals so that filtering and
+    # faceting work on integer codes rather than Python strings
+    renamed_data["dataset"] = renamed_data["dataset"].astype("category")
+    # n_qubits is sorted numerically once here so that "10" follows "9"
+    renamed_data["n_qubits"] = pd.Categorical(
+        renamed_data["n_qubits"],
+        categories=sorted(
+            renamed_data["n_qubits"].unique(),
+            key=lambda qb: int(qb) if qb.isdigit() else float("inf"),
+        ),
+        ordered=True,
+    )
+    renamed_data["dataset type"] = renamed_data["dataset type"].astype("category")
     return renamed_data
 
+def cache_root(results_folder):
+    return results_folder / ".cache" / f"v{CACHE_VERSION}"
+
+def load_cached_data(results_folder):
+    # The cache is valid as long as no CSV file was added, removed or
+    # modified since it was written, and it was written by the same
+    # CACHE_VERSION of this script
+    cache_path = cache_root(results_folder) / "all_data.parquet"
+    mtimes = [p.stat().st_mtime for p in results_folder.rglob("*.csv")]
+    mtimes += [
+        folder.stat().st_mtime
+        for folder in [results_folder / "quartz", results_folder / "portmatching"]
+    ]
+    if cache_path.exists() and cache_path.stat().st_mtime >= max(mtimes):
+        return pd.read_parquet(cache_path)
+
+    all_data = rename_data_columns(load_data(results_folder))
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    all_data.to_parquet(cache_path)
+    return all_data
+
+def split_data(all_data):
+    # Split the data once into per-(dataset type, n_qubits) facets, shared
+    # by all plots. observed=True skips unused category combinations, and the
+    # facets of each dataset type are kept in numeric n_qubits order
+    facets = {}
+    groups = all_data.groupby(["dataset type", "n_qubits"], observed=True)
+    for (dataset_type, n_qubits), group in groups:
+        facets.setdefault(dataset_type, {})[n_qubits] = group
+    return facets
 
 # Path to the results folder
 results_folder = get_results_folder()
 
-# Load all CSV data
-all_data = load_data(results_folder)
+# Load all CSV data and rename the columns for plotting, or reuse the
+# cached result of a previous run
+all_data = load_cached_data(results_folder)
 
-# Rename the columns for plotting
-all_data = rename_data_columns(all_data)
+# Split the data by dataset type and number of qubits
+facets = split_data(all_data)
 
 # Create a plot comparing portmatching with quartz
-create_eccs_plot(all_data)
+if "eccs" in facets:
+    create_eccs_plot(facets["eccs"])
 
 # Create a plot comparing portmatching across qubit counts
-create_random_plot(all_data)
+if "random" in facets:
+    create_random_plot(facets["random"])
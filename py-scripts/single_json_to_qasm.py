@@ -2,20 +2,32 @@
 Converts a TKET JSON string to a QASM string using the
 pytket.qasm.circuit_to_qasm converter.
 
-Usage: python single_qasm_to_json.py <qasm string>
+Usage: python single_json_to_qasm.py <json string>
+       python single_json_to_qasm.py --batch
+
+In batch mode, every line of stdin is a TKET JSON circuit and each
+converted QASM string is written to stdout JSON-encoded, one per line.
+This avoids paying the pytket import once per circuit.
 """
 
-import os
 import sys
-import json
+import orjson
 from pytket import Circuit
 from pytket.qasm import circuit_to_qasm_str
 
+
+def json_to_qasm(json_str):
+    circuit = Circuit.from_dict(orjson.loads(json_str))
+    return circuit_to_qasm_str(circuit)
+
+
 if len(sys.argv) != 2:
-    print("Usage: python single_json_to_qasm.py <folder>")
+    print("Usage: python single_json_to_qasm.py <json string> | --batch")
     sys.exit(1)
 
-json_str = sys.argv[1]
-
-circuit = Circuit.from_dict(json.loads(json_str))
-print(circuit_to_qasm_str(circuit))
\ No newline at end of file
+if sys.argv[1] == "--batch":
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(orjson.dumps(json_to_qasm(line)).decode() + "\n")
+else:
+    print(json_to_qasm(sys.argv[1]))
@@ -3,18 +3,30 @@ Converts a QASM string to a TKET JSON string using the
 pytket.qasm.circuit_from_qasm converter.
 
 Usage: python single_qasm_to_json.py <qasm string>
+       python single_qasm_to_json.py --batch
+
+In batch mode, every line of stdin is a JSON-encoded QASM string and the
+TKET JSON of each circuit is written to stdout, one per line. This avoids
+paying the pytket import once per circuit.
 """
 
-import os
 import sys
-import json
+import orjson
 from pytket.qasm import circuit_from_qasm_str
 
+
+def qasm_to_json(qasm):
+    circuit = circuit_from_qasm_str(qasm)
+    return orjson.dumps(circuit.to_dict()).decode()
+
+
 if len(sys.argv) != 2:
-    print("Usage: python single_qasm_to_json.py <folder>")
+    print("Usage: python single_qasm_to_json.py <qasm string> | --batch")
     sys.exit(1)
 
-qasm = sys.argv[1]
-
-circuit = circuit_from_qasm_str(qasm)
-print(json.dumps(circuit.to_dict()))
\ No newline at end of file
+if sys.argv[1] == "--batch":
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(qasm_to_json(orjson.loads(line)) + "\n")
+else:
+    print(qasm_to_json(sys.argv[1]))